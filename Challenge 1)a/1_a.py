@@ -1,101 +1,238 @@
 import os
 import json
 import re
+import mmap
+import functools
+import multiprocessing
 import time
 import statistics
 from pathlib import Path
-from collections import Counter, defaultdict
+import numpy as np
 import pymupdf
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MIN_PAGES_PER_WORKER = 16
+CLEAN_TEXT_CACHE_SIZE = 4096
+BOLD_FLAG = 1 << 4
+# Text only: image blocks are never requested, so MuPDF does not decode them.
+TEXT_FLAGS = (pymupdf.TEXT_PRESERVE_LIGATURES
+              | pymupdf.TEXT_PRESERVE_WHITESPACE
+              | pymupdf.TEXT_INHIBIT_SPACES)
+
+class SpanArrays:
+    """Text spans stored column-wise: one numpy array (or list) per field."""
+
+    _ARRAY_DTYPES = (
+        ("size", np.float32),
+        ("flags", np.int32),
+        ("page", np.int32),
+        ("x", np.float32),
+        ("relative_y", np.float64),
+        ("line_y", np.float32),
+    )
+    __slots__ = ("text",) + tuple(name for name, _ in _ARRAY_DTYPES)
+
+    def __init__(self, text, **arrays):
+        self.text = text
+        for name, dtype in self._ARRAY_DTYPES:
+            setattr(self, name, np.asarray(arrays[name], dtype=dtype))
+
+    @classmethod
+    def empty(cls, count):
+        return cls([None] * count,
+                   **{name: np.empty(count, dtype) for name, dtype in cls._ARRAY_DTYPES})
+
+    def __len__(self):
+        return len(self.text)
+
+class LineArrays:
+    """Merged text lines stored column-wise, in the same layout as SpanArrays."""
+
+    _ARRAY_DTYPES = (
+        ("size", np.float32),
+        ("has_bold", np.bool_),
+        ("page", np.int32),
+        ("relative_y", np.float64),
+    )
+    __slots__ = ("text",) + tuple(name for name, _ in _ARRAY_DTYPES)
+
+    def __init__(self, text, **arrays):
+        self.text = text
+        for name, dtype in self._ARRAY_DTYPES:
+            setattr(self, name, np.asarray(arrays[name], dtype=dtype))
+
+    @classmethod
+    def concat(cls, parts):
+        return cls([text for part in parts for text in part.text],
+                   **{name: np.concatenate([getattr(part, name) for part in parts] or [[]])
+                      for name, _ in cls._ARRAY_DTYPES})
+
+    def __len__(self):
+        return len(self.text)
+
+def _open_pdf(pdf_path):
+    # Map the file rather than reading it through stdio: MuPDF parses straight
+    # out of the page cache, and the Document keeps the mapping alive through
+    # its reference to the stream.
+    with open(pdf_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_WILLNEED"):
+        mm.madvise(mmap.MADV_WILLNEED)
+    return pymupdf.open(stream=memoryview(mm), filetype="pdf")
+
+def _page_elements(page, page_num, heading_band=None):
+    rect = page.rect
+    clip = None
+    if heading_band and page_num > 0:
+        # Past the first page, only read the top band where section headings sit.
+        clip = pymupdf.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * heading_band)
+    # extractDICT is the cheapest extraction that still carries font size and
+    # flags: extractBLOCKS/extractWORDS drop them and extractRAWDICT adds a
+    # dict per character on top of the span dicts.
+    blocks = page.get_textpage(clip=clip, flags=TEXT_FLAGS).extractDICT(sort=False)["blocks"]
+    lines = [line for block in blocks if "lines" in block for line in block["lines"]]
+
+    # Count first so every column is allocated once at its final size.
+    count = sum(1 for line in lines for span in line["spans"]
+                if span["text"] and not span["text"].isspace())
+    spans = SpanArrays.empty(count)
+    page_height = rect.height
+    i = 0
+    for line in lines:
+        line_y = line["bbox"][1]
+        for span in line["spans"]:
+            text = span["text"].strip()
+            if text:
+                bbox = span["bbox"]
+                spans.text[i] = text
+                spans.size[i] = span["size"]
+                spans.flags[i] = span["flags"]
+                spans.x[i] = bbox[0]
+                spans.relative_y[i] = bbox[1] / page_height
+                spans.line_y[i] = line_y
+                i += 1
+    spans.page[:] = page_num + 1
+    return spans
+
+def _extract_range(job):
+    # Pool worker: re-opens the file and returns SpanArrays for pages
+    # [start, end), so only plain arrays cross the process boundary.
+    pdf_path, start, end, heading_band = job
+    doc = _open_pdf(pdf_path)
+    try:
+        return [_page_elements(doc[page_num], page_num, heading_band)
+                for page_num in range(start, end)]
+    finally:
+        doc.close()
+
+def _prefetch(path):
+    # Queue kernel readahead for a file without waiting for it; fadvise only
+    # schedules the I/O.
+    if path is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _range_workers(page_count):
+    # Pool workers are daemonic and cannot start pools of their own, so a
+    # document being processed inside process_folder is read sequentially.
+    if multiprocessing.current_process().daemon:
+        return 1
+    return min(os.cpu_count() or 1, page_count // MIN_PAGES_PER_WORKER)
+
 class PDFOutlineExtractor:
-    def __init__(self, debug=False):
-        self.debug = debug
+    _WS_RE = re.compile(r'\s+')
+    _NUMHEAD_RE = re.compile(r'^\d+[\.\)]')
 
-    def is_bold(self, flags):
-        return bool(flags & (1 << 4))
+    def __init__(self, debug=False, heading_band=None):
+        self.debug = debug
+        self.heading_band = heading_band
 
-    def clean_text(self, text):
-        return re.sub(r'\s+', ' ', text).strip()
+    @staticmethod
+    @functools.lru_cache(maxsize=CLEAN_TEXT_CACHE_SIZE)
+    def clean_text(text):
+        # Headers, footers and page numbers repeat across pages, so the
+        # bounded cache skips most of the regex work on long documents.
+        return PDFOutlineExtractor._WS_RE.sub(' ', text).strip()
 
     def detect_document_type(self, text_elements):
-        sample_text = ' '.join([elem['text'].lower() for elem in text_elements[:100]])
+        sample_text = ' '.join([text.lower() for text in text_elements.text[:100]])
         
         if any(word in sample_text for word in ['form', 'application']):
             return 'form'
         return 'standard_document'
 
-    def extract_text_with_metadata(self, doc):
-        pages = []
-        for page_num, page in enumerate(doc):
-            rect = page.rect
-            blocks = page.get_text("dict", flags=11)["blocks"]
-            page_elements = []
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        line_bbox = line["bbox"]
-                        for span in line["spans"]:
-                            text = span["text"].strip()
-                            if text:
-                                bbox = span["bbox"]
-                                page_elements.append({
-                                    "text": text,
-                                    "font": span["font"],
-                                    "size": span["size"],
-                                    "flags": span["flags"],
-                                    "page": page_num + 1,
-                                    "bbox": bbox,
-                                    "x": bbox[0],
-                                    "y": bbox[1],
-                                    "width": bbox[2] - bbox[0],
-                                    "height": bbox[3] - bbox[1],
-                                    "page_width": rect.width,
-                                    "page_height": rect.height,
-                                    "relative_x": bbox[0] / rect.width,
-                                    "relative_y": bbox[1] / rect.height,
-                                    "line_y": line_bbox[1]
-                                })
-            pages.append(page_elements)
-        return pages
-
-    def merge_by_line(self, elements, tol=3):
-        lines = defaultdict(list)
-        for elem in elements:
-            key = round(elem["line_y"] / tol) * tol
-            lines[key].append(elem)
-
-        merged = []
-        for key in sorted(lines):
-            spans = lines[key]
-            spans.sort(key=lambda e: e["x"])
-            full_text = " ".join(span["text"] for span in spans)
-            full_text = self.clean_text(full_text)
-            if not full_text:
-                continue
-            max_size = max(span["size"] for span in spans)
-            is_bold = any(self.is_bold(span["flags"]) for span in spans)
-            rep = spans[0]
-            merged.append({
-                "text": full_text,
-                "size": max_size,
-                "flags": rep["flags"],
-                "has_bold": is_bold,
-                "page": rep["page"],
-                "relative_x": rep["relative_x"],
-                "relative_y": rep["relative_y"],
-                "line_y": key
-            })
-        return merged
+    def extract_text_with_metadata(self, pdf_path):
+        # Yields one SpanArrays per page so callers can consume the document
+        # incrementally instead of holding every page in memory at once.
+        doc = _open_pdf(pdf_path)
+        page_count = doc.page_count
+        workers = _range_workers(page_count)
+        if workers < 2:
+            try:
+                for page_num, page in enumerate(doc):
+                    yield _page_elements(page, page_num, self.heading_band)
+            finally:
+                doc.close()
+            return
+        doc.close()
+
+        step = -(-page_count // workers)
+        jobs = [(str(pdf_path), start, min(start + step, page_count), self.heading_band)
+                for start in range(0, page_count, step)]
+        with multiprocessing.Pool(len(jobs)) as pool:
+            for segment in pool.imap(_extract_range, jobs):
+                yield from segment
+
+    def merge_by_line(self, spans, tol=3):
+        if not len(spans):
+            return LineArrays.concat([])
+        bins = np.round(spans.line_y.astype(np.float64) / tol).astype(np.int64)
+
+        # Group by (page, line), keeping spans within a line in left-to-right order.
+        order = np.lexsort((spans.x, bins, spans.page))
+        bins_sorted = bins[order]
+        new_line = (np.diff(bins_sorted) != 0) | (np.diff(spans.page[order]) != 0)
+        starts = np.concatenate(([0], np.nonzero(new_line)[0] + 1))
+        ends = np.append(starts[1:], len(order))
+        max_sizes = np.maximum.reduceat(spans.size[order], starts)
+        bold_flags = np.bitwise_or.reduceat(spans.flags[order] & BOLD_FLAG, starts)
+
+        texts = [self.clean_text(" ".join(spans.text[i] for i in order[start:end]))
+                 for start, end in zip(starts, ends)]
+        keep = np.fromiter(map(bool, texts), dtype=bool, count=len(texts))
+        rep = order[starts[keep]]
+        return LineArrays(
+            [text for text in texts if text],
+            size=max_sizes[keep],
+            has_bold=bold_flags[keep] != 0,
+            page=spans.page[rep],
+            relative_y=spans.relative_y[rep],
+        )
 
     def analyze_font_distribution(self, lines):
-        sizes = [line["size"] for line in lines if line["size"] > 0]
-        if not sizes:
+        sizes = lines.size[lines.size > 0]
+        if not sizes.size:
             return [], 12  
 
-        counts = Counter(sizes)
-        base_size = counts.most_common(1)[0][0]
-        significant_sizes = [size for size in counts if size > base_size and counts[size] < len(lines) * 0.4]
-        significant_sizes = sorted(set(significant_sizes), reverse=True)
+        values, first_seen, counts = np.unique(sizes, return_index=True, return_counts=True)
+        # Ties go to the size that appears first, as Counter.most_common did.
+        most_common = np.flatnonzero(counts == counts.max())
+        base_size = float(values[most_common[np.argmin(first_seen[most_common])]])
+        significant = (values > base_size) & (counts < len(lines) * 0.4)
+        significant_sizes = values[significant][::-1].tolist()
 
         if self.debug:
             print(f"[DEBUG] Base font size: {base_size}")
@@ -103,87 +240,83 @@ class PDFOutlineExtractor:
 
         return significant_sizes[:3], base_size
 
-    def is_heading_candidate(self, element, sig_sizes, base_size):
-        txt = self.clean_text(element["text"])
-        if len(txt) < 3 or txt.isdigit():
-            return False
-        if element["size"] in sig_sizes:
-            return True
-        if element["has_bold"] and element["size"] >= base_size:
-            return True
-        if txt.isupper() and len(txt) > 6:
-            return True
-        if re.match(r'^\d+[\.\)]', txt):
-            return True
-        if element["relative_y"] < 0.2:
-            return True
-        return False
-
-    def assign_heading_levels(self, candidates, sig_sizes):
+    def heading_candidates(self, lines, sig_sizes, base_size):
+        texts = lines.text
+        count = len(texts)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=count)
+        is_digit = np.fromiter((t.isdigit() for t in texts), dtype=bool, count=count)
+        is_upper = np.fromiter((t.isupper() for t in texts), dtype=bool, count=count)
+
+        valid = (lengths > 3) & ~is_digit
+        mask = valid & (np.isin(lines.size, sig_sizes)
+                        | (lines.relative_y < 0.2)
+                        | (lines.has_bold & (lines.size >= base_size))
+                        | (is_upper & (lengths > 6)))
+        # The regex is the slowest test, so it only runs on lines nothing else matched.
+        rest = np.flatnonzero(valid & ~mask)
+        mask[rest] = [self._NUMHEAD_RE.match(texts[i]) is not None for i in rest]
+        return np.flatnonzero(mask)
+
+    def assign_heading_levels(self, lines, candidates, sig_sizes):
         level_map = {size: f"H{i+1}" for i, size in enumerate(sig_sizes)}
         headings = []
-        for c in candidates:
-            level = level_map.get(c["size"], "H3")
-            txt = self.clean_text(c["text"])
+        seen = set()
+        for i in candidates:
+            level = level_map.get(float(lines.size[i]), "H3")
+            key = (level, lines.text[i])
+            if key in seen:
+                continue
+            seen.add(key)
             headings.append({
                 "level": level,
-                "text": txt,
-                "page": c["page"]
+                "text": lines.text[i],
+                "page": int(lines.page[i])
             })
         return headings
 
-    def get_title(self, pages):
-        if not pages:
-            return ""
-        first_page = pages[0]
-        cand = []
-        for e in first_page:
-            txt = self.clean_text(e["text"])
-            if len(txt) > 10 and e["relative_y"] < 0.3:
-                cand.append((e["size"], txt))
-        if cand:
-            
-            return sorted(cand, key=lambda x: x[0], reverse=True)[0][1]
-        return ""
+    def get_title(self, first_page):
+        best = ("", -1.0)
+        for i, text in enumerate(first_page.text):
+            if first_page.relative_y[i] >= 0.3:
+                continue
+            size = float(first_page.size[i])
+            if size > best[1]:
+                txt = self.clean_text(text)
+                if len(txt) > 10:
+                    best = (txt, size)
+        return best[0]
 
     def extract_outline(self, pdf_path):
         try:
-            doc = pymupdf.open(pdf_path)
-            pages = self.extract_text_with_metadata(doc)
-            doc.close()
-
-            title = self.get_title(pages)
+            title = ""
+            page_lines = []
+            for page_num, spans in enumerate(self.extract_text_with_metadata(pdf_path)):
+                if page_num == 0:
+                    title = self.get_title(spans)
+                page_lines.append(self.merge_by_line(spans))
+            merged = LineArrays.concat(page_lines)
             if not title:
                 title = Path(pdf_path).stem.replace('_', ' ').title()
 
-            all_elements = [el for page in pages for el in page]
-            merged = self.merge_by_line(all_elements)
             sig_sizes, base_size = self.analyze_font_distribution(merged)
 
-            candidates = [el for el in merged if self.is_heading_candidate(el, sig_sizes, base_size)]
-            headings = self.assign_heading_levels(candidates, sig_sizes)
+            candidates = self.heading_candidates(merged, sig_sizes, base_size)
+            headings = self.assign_heading_levels(merged, candidates, sig_sizes)
 
-        
-            seen = set()
-            unique_headings = []
-            for h in headings:
-                key = (h["level"], h["text"])
-                if key not in seen and len(h["text"]) > 3:
-                    seen.add(key)
-                    unique_headings.append(h)
-
-            return {"title": title, "outline": unique_headings}
+            return {"title": title, "outline": headings}
         except Exception as e:
             print(f"Failed to process {pdf_path}: {e}")
             return {"title": Path(pdf_path).stem, "outline": []}
 
     def process_and_save(self, pdf_path, output_dir):
         output_dir = Path(output_dir)
-        output_dir.mkdir(exist_ok=True, parents=True)
         outline = self.extract_outline(pdf_path)
         output_file = output_dir / f"output_{Path(pdf_path).stem}.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(outline, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            output_file.write_bytes(orjson.dumps(outline, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(outline, f, indent=2, ensure_ascii=False)
         print(f"Saved outline to {output_file}")
 
     def process_folder(self, input_dir, output_dir):
@@ -196,13 +329,29 @@ class PDFOutlineExtractor:
             print(f"No PDFs found in {input_dir}")
             return
         print(f"Processing {len(pdf_files)} PDFs from {input_dir}")
-        for pdf in pdf_files:
-            print(f"Processing {pdf.name} ...")
-            self.process_and_save(pdf, output_dir)
+        Path(output_dir).mkdir(exist_ok=True, parents=True)
+        next_files = [str(pdf) for pdf in pdf_files[1:]] + [None]
+        jobs = [(str(pdf), next_pdf, str(output_dir), self.debug, self.heading_band)
+                for pdf, next_pdf in zip(pdf_files, next_files)]
+        workers = min(os.cpu_count() or 1, len(pdf_files))
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(_process_one, jobs)
         print(f"All processed. Outputs in {output_dir}")
 
-def main(input_dir="dataset", output_dir="output", debug=False):
-    extractor = PDFOutlineExtractor(debug=debug)
+def _process_one(job):
+    # Pool worker: each process builds its own extractor and opens its own
+    # document, so no PyMuPDF objects are shared across processes.
+    pdf_path, next_path, output_dir, debug, heading_band = job
+    # Read ahead one file only, so its I/O overlaps this parse without
+    # flooding the page cache on large corpora.
+    _prefetch(next_path)
+    print(f"Processing {Path(pdf_path).name} ...")
+    extractor = PDFOutlineExtractor(debug=debug, heading_band=heading_band)
+    extractor.process_and_save(pdf_path, output_dir)
+
+def main(input_dir="dataset", output_dir="output", debug=False, heading_band=None):
+    extractor = PDFOutlineExtractor(debug=debug, heading_band=heading_band)
     extractor.process_folder(input_dir, output_dir)
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file